@@ -1,21 +1,22 @@
 import os
 import re
 import sys
+import tomllib
 from subprocess import check_output
 
-import toml
 from gql import Client, gql
 from gql.transport.aiohttp import AIOHTTPTransport
 from packaging import version
 
 # Fetch version information
-new_pyproject = toml.load("pyproject.toml")
+with open("pyproject.toml", "rb") as f:
+    new_pyproject = tomllib.load(f)
 new_name = new_pyproject["project"]["name"]
 new_version = version.parse(new_pyproject["project"]["version"])
 old_pyproject_s = check_output(
     ["git", "show", "origin/main:pyproject.toml"], encoding="utf-8"
 )
-old_pyproject = toml.loads(old_pyproject_s)
+old_pyproject = tomllib.loads(old_pyproject_s)
 old_name = old_pyproject["project"]["name"]
 old_version = version.parse(old_pyproject["project"]["version"])
 print(f"Old {old_name} version: {old_version}")
@@ -54,23 +55,26 @@ def fetch_pr_labels() -> set[str]:
     return {n["name"] for n in result["repository"]["pullRequest"]["labels"]["nodes"]}
 
 
-norelease = "norelease" in fetch_pr_labels()
+def is_norelease() -> bool:
+    return "norelease" in fetch_pr_labels()
 
+
+# Only fetch the PR labels when they can change the outcome
 if old_name != new_name:
-    if norelease:
+    if is_norelease():
         print("norelease PRs cannot change the project name", file=sys.stderr)
         sys.exit(1)
 elif old_version > new_version:
     print("Version is older in this PR than on destination branch", file=sys.stderr)
     sys.exit(1)
 elif old_version == new_version:
-    if not norelease:
+    if not is_norelease():
         print(
             "PRs must bump the project version prior to merging,"
             " or be tagged norelease",
             file=sys.stderr,
         )
         sys.exit(1)
-elif norelease:
+elif is_norelease():
     print("norelease PRs must not bump the project version", file=sys.stderr)
     sys.exit(1)
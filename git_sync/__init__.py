@@ -1,5 +1,6 @@
 import sys
-from asyncio import create_task, run
+from asyncio import create_task, gather, run
+from functools import cache
 from os import environ
 
 from .git import (
@@ -14,26 +15,33 @@ from .git import (
 from .github import fetch_pull_requests
 
 
+@cache
 def github_token(domain: str) -> str | None:
     envvar = domain.split(".")[0].upper() + "_TOKEN"
     return environ.get(envvar)
 
 
 async def git_sync() -> None:
-    push_remote = await get_default_push_remote()
-    if push_remote:
-        remotes = await get_remotes()
-        if remotes:
-            pull_request_task = create_task(
-                fetch_pull_requests(github_token, [remote.url for remote in remotes])
-            )
+    # These are independent, so overlap the git process startup costs
+    branches_task = create_task(get_branches_with_remote_upstreams())
+    push_remote, remotes = await gather(get_default_push_remote(), get_remotes())
+    # A remote may have several URLs; the first is the one git fetches from
+    remote_urls: dict[bytes, str] = {}
+    for remote in remotes:
+        remote_urls.setdefault(remote.name, remote.url)
+    if push_remote and remotes:
+        # Start the network request now so it overlaps all the local git work
+        pull_request_task = create_task(
+            fetch_pull_requests(github_token, [remote.url for remote in remotes])
+        )
 
     try:
-        branches = await get_branches_with_remote_upstreams()
+        branches = await branches_task
     except GitError as e:
         # Probably not in a git directory, or some other misconfiguration.
         # git will already have written the problem to stderr.
         sys.exit(e.returncode)
+
     await fetch_and_fast_forward_to_upstream(branches)
 
     if push_remote:
@@ -41,10 +49,7 @@ async def git_sync() -> None:
 
         if remotes:
             pull_requests = await pull_request_task
-            push_remote_url = next(
-                remote.url for remote in remotes if remote.name == push_remote
-            )
-            await fast_forward_merged_prs(push_remote_url, pull_requests)
+            await fast_forward_merged_prs(remote_urls[push_remote], pull_requests)
 
 
 def main() -> None:
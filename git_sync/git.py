@@ -1,11 +1,19 @@
+from asyncio import Semaphore, gather
 from asyncio.subprocess import PIPE, create_subprocess_exec
-from collections.abc import Iterable
+from collections.abc import AsyncIterator, Iterable
 from dataclasses import dataclass
+from os import environ
 
 from .github import PullRequest
 
 _ExecArg = bytes | str
 
+# Skip optional lock files (e.g. the index refresh), which none of our
+# commands rely on and which serialize concurrent git processes, and never
+# start a pager. Terminal prompts stay enabled so fetch and push can still
+# ask for credentials.
+_GIT_ENV = {**environ, "GIT_OPTIONAL_LOCKS": "0", "GIT_PAGER": "cat"}
+
 
 class GitError(Exception):
     def __init__(self, args: Iterable[_ExecArg], returncode: int) -> None:
@@ -20,59 +28,87 @@ class GitError(Exception):
 
 async def git(*args: _ExecArg, check_return: bool = True) -> None:
     """Call git"""
-    proc = await create_subprocess_exec("git", *args)
+    proc = await create_subprocess_exec("git", *args, env=_GIT_ENV)
     returncode = await proc.wait()
     if returncode != 0 and check_return:
         raise GitError(args, returncode)
 
 
-async def git_output(*args: _ExecArg, check_return: bool = True) -> bytes:
-    """Call git and return stdout"""
-    proc = await create_subprocess_exec("git", *args, stdout=PIPE)
-    assert proc.stdout  # work around typeshed limitation
-    stdout = await proc.stdout.read()
+async def git_output(
+    *args: _ExecArg, check_return: bool = True, input: bytes | None = None
+) -> bytes:
+    """Call git and return stdout, optionally writing input to stdin"""
+    proc = await create_subprocess_exec(
+        "git",
+        *args,
+        stdin=None if input is None else PIPE,
+        stdout=PIPE,
+        env=_GIT_ENV,
+    )
+    stdout, _ = await proc.communicate(input)
     returncode = await proc.wait()
     if returncode != 0 and check_return:
         raise GitError(args, returncode)
     return stdout.rstrip(b"\r\n")
 
 
+async def git_lines(*args: _ExecArg, check_return: bool = True) -> AsyncIterator[bytes]:
+    """Call git and yield each line of stdout as it is produced"""
+    proc = await create_subprocess_exec("git", *args, stdout=PIPE, env=_GIT_ENV)
+    assert proc.stdout  # work around typeshed limitation
+    async for line in proc.stdout:
+        yield line.rstrip(b"\r\n")
+    returncode = await proc.wait()
+    if returncode != 0 and check_return:
+        raise GitError(args, returncode)
+
+
 @dataclass
 class Branch:
     name: bytes
+    short_name: bytes
     upstream: bytes
+    hash: str
     is_current: bool
 
 
-async def get_current_branch() -> bytes | None:
-    raw_bytes = await git_output("symbolic-ref", "-q", "HEAD", check_return=False)
-    return raw_bytes or None
-
-
 async def get_default_push_remote() -> bytes | None:
     raw_bytes = await git_output("config", "remote.pushdefault", check_return=False)
     return raw_bytes or None
 
 
-async def get_branch_hashes() -> dict[bytes, str]:
-    raw_bytes = await git_output(
-        "for-each-ref", "--format=%(refname) %(objectname)", "refs/heads"
+# %(HEAD) is "*" for the current branch and " " otherwise, and %(upstream) is
+# empty for branches with no upstream
+_BRANCH_FORMAT = "--format=%(HEAD) %(refname) %(upstream) %(objectname)"
+
+
+def _parse_branch(line: bytes) -> Branch:
+    name, _, rest = line[2:].partition(b" ")
+    upstream, _, hash = rest.partition(b" ")
+    return Branch(
+        name=name,
+        short_name=name.removeprefix(b"refs/heads/"),
+        upstream=upstream,
+        hash=hash.decode("ascii"),
+        is_current=line.startswith(b"*"),
     )
-    return {
-        ref[11:]: hash.decode("ascii")
-        for (ref, hash) in (line.split(b" ") for line in raw_bytes.splitlines())
-    }
+
+
+async def get_branches() -> list[Branch]:
+    """List all local branches with a single for-each-ref call"""
+    return [
+        _parse_branch(line)
+        async for line in git_lines("for-each-ref", _BRANCH_FORMAT, "refs/heads")
+    ]
 
 
 async def get_branches_with_remote_upstreams() -> list[Branch]:
-    current_branch = await get_current_branch()
-    raw_bytes = await git_output(
-        "for-each-ref", "--format=%(refname) %(upstream)", "refs/heads"
-    )
+    # Refnames cannot contain spaces, so this only matches the upstream field,
+    # and lets us skip parsing branches we will discard
     return [
-        Branch(name=name, upstream=upstream, is_current=(name == current_branch))
-        for name, upstream in (line.split(b" ") for line in raw_bytes.splitlines())
-        if upstream.startswith(b"refs/remotes/")
+        _parse_branch(line)
+        async for line in git_lines("for-each-ref", _BRANCH_FORMAT, "refs/heads")
+        if b" refs/remotes/" in line
     ]
 
 
@@ -83,20 +119,52 @@ class Remote:
 
 
 async def get_remotes() -> list[Remote]:
-    raw_bytes = await git_output(
+    remotes = []
+    async for line in git_lines(
         "config", "--get-regexp", r"remote\..*\.url", check_return=False
-    )
-    return [
-        Remote(name=name[7:-4], url=url.decode("ascii"))
-        for (name, url) in (line.split(b" ") for line in raw_bytes.splitlines())
-    ]
+    ):
+        name, _, url = line.partition(b" ")
+        remotes.append(Remote(name=name[7:-4], url=url.decode("ascii")))
+    return remotes
+
+
+async def get_remote_branches(
+    remote: bytes, short_names: Iterable[bytes]
+) -> set[bytes]:
+    """Return which of the given branches exist on the remote
+
+    Lists the remote's refs with a single prefix pattern, as for-each-ref matches
+    every ref against every pattern given, but only keeps the requested refs.
+    """
+    prefix = b"refs/remotes/" + remote + b"/"
+    wanted = {prefix + name for name in short_names}
+    if not wanted:
+        return set()
+    return {
+        ref
+        async for ref in git_lines(
+            "for-each-ref", "--format=%(refname)", b"refs/remotes/" + remote
+        )
+        if ref in wanted
+    }
+
 
+async def get_existing_objects(hashes: Iterable[str]) -> set[str]:
+    """Return which of the given object hashes exist in the local repository
 
-async def get_remote_branches(remote: bytes) -> list[bytes]:
+    Checks all the hashes with a single cat-file call.
+    """
+    batch = "".join(f"{hash}\n" for hash in hashes)
+    if not batch:
+        return set()
     raw_bytes = await git_output(
-        "for-each-ref", "--format=%(refname)", b"refs/remotes/" + remote
+        "cat-file", "--batch-check=%(objectname)", input=batch.encode("ascii")
     )
-    return raw_bytes.splitlines()
+    return {
+        line.decode("ascii")
+        for line in raw_bytes.splitlines()
+        if not line.endswith(b" missing")
+    }
 
 
 async def is_ancestor(commit1: _ExecArg, commit2: _ExecArg) -> bool:
@@ -119,10 +187,18 @@ async def is_ancestor(commit1: _ExecArg, commit2: _ExecArg) -> bool:
 
 
 async def fetch_and_fast_forward_to_upstream(branches: Iterable[Branch]) -> None:
-    if any(b.is_current for b in branches):
-        await git("pull", "--all")
-    else:
-        await git("fetch", "--all")
+    branches = list(branches)
+    # Fetch from up to 8 remotes in parallel
+    await git("fetch", "--all", "--jobs=8")
+    current = next((b for b in branches if b.is_current), None)
+    if current:
+        # fetch never moves the checked-out branch, so its hash is still current
+        upstream_hash = await git_output("rev-parse", current.upstream)
+        if upstream_hash.decode("ascii") != current.hash and await is_ancestor(
+            current.name, current.upstream
+        ):
+            # Updates the working tree too, which the local fetch below cannot do
+            await git("merge", "--ff-only", current.upstream)
     fetch_args = [b.upstream + b":" + b.name for b in branches if not b.is_current]
     if fetch_args:
         # Ignore return code as fetch will exit with a non-zero code if any
@@ -134,21 +210,37 @@ async def fetch_and_fast_forward_to_upstream(branches: Iterable[Branch]) -> None
 async def fast_forward_to_downstream(
     push_remote: bytes, branches: Iterable[Branch]
 ) -> None:
-    remote_branches = set(await get_remote_branches(push_remote))
+    branches = list(branches)
+    remote_branches = await get_remote_branches(
+        push_remote, (b.short_name for b in branches)
+    )
+    to_push: list[bytes] = []
+    remote_prefix = b"refs/remotes/" + push_remote + b"/"
     for b in branches:
-        # All branches start with refs/heads/
-        short_branch_name = b.name[11:]
-        remote = b"refs/remotes/" + push_remote + b"/" + short_branch_name
+        remote = remote_prefix + b.short_name
         if remote in remote_branches and b.upstream != remote:
-            await git("push", push_remote, short_branch_name)
+            to_push.append(b.short_name)
+    if to_push:
+        # A single push updates each ref independently over one connection
+        await git("push", push_remote, *to_push)
 
 
 async def fast_forward_merged_prs(
-    push_remote_url: str, prs: Iterable[PullRequest]
+    push_remote_url: str,
+    prs: Iterable[PullRequest],
+    *,
+    max_concurrency: int = 8,
 ) -> None:
-    current_branch = await get_current_branch()
-    current_branch = current_branch and current_branch[11:]
-    branch_hashes = await get_branch_hashes()
+    """Fast-forward local branches to the merge commit of their merged PR
+
+    Ancestry checks are read-only, so they are issued concurrently; the
+    branch updates themselves are applied one at a time.
+    """
+    # Re-read the branches, as the earlier steps may have moved them
+    branches = await get_branches()
+    current_branch = next((b.short_name for b in branches if b.is_current), None)
+    branch_hashes = {b.short_name: b.hash for b in branches}
+    candidates: list[tuple[PullRequest, bytes, str]] = []
     for pr in prs:
         branch_name = pr.branch_name.encode("utf-8")
         merged_hash = pr.merged_hash
@@ -158,14 +250,36 @@ async def fast_forward_merged_prs(
             and merged_hash != branch_hashes[branch_name]
             and push_remote_url in pr.repo_urls
         ):
+            candidates.append((pr, branch_name, merged_hash))
+    # Skip spawning merge-base where the answer is already known: the branch
+    # may still be the PR head, or the PR head may not exist locally
+    existing = await get_existing_objects(
+        pr.branch_hash
+        for pr, branch_name, _ in candidates
+        if pr.branch_hash != branch_hashes[branch_name]
+    )
+    semaphore = Semaphore(max_concurrency)
+
+    async def branch_is_ancestor(pr: PullRequest, branch_name: bytes) -> bool:
+        if pr.branch_hash == branch_hashes[branch_name]:
+            return True
+        if pr.branch_hash not in existing:
+            return False
+        async with semaphore:
             try:
-                branch_is_ancestor = await is_ancestor(branch_name, pr.branch_name)
+                return await is_ancestor(branch_name, pr.branch_hash)
             except GitError:
-                pass  # Probably no longer have the commit hash
+                return False  # Probably no longer have the commit hash
+
+    results = await gather(
+        *(branch_is_ancestor(pr, branch_name) for pr, branch_name, _ in candidates)
+    )
+    for (pr, branch_name, merged_hash), is_merged_branch in zip(
+        candidates, results, strict=True
+    ):
+        if is_merged_branch:
+            print(f"Fast-forward {pr.branch_name} to {merged_hash}")
+            if branch_name == current_branch:
+                await git("reset", "--hard", merged_hash)
             else:
-                if branch_is_ancestor:
-                    print(f"Fast-forward {pr.branch_name} to {pr.merged_hash}")
-                    if branch_name == current_branch:
-                        await git("reset", "--hard", merged_hash)
-                    else:
-                        await git("branch", "--force", branch_name, merged_hash)
+                await git("branch", "--force", branch_name, merged_hash)
@@ -2,9 +2,10 @@ import re
 from asyncio import Semaphore, gather
 from collections.abc import AsyncIterator, Callable, Iterable
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import TypeVar
 
-from aiographql.client import GraphQLClient  # type: ignore[import-untyped]
+from aiohttp import ClientSession
 
 T = TypeVar("T")
 
@@ -16,10 +17,13 @@ class Repository:
     name: str
 
 
-HTTPS_URL = re.compile(r"^https://([^/]*)/([^/]*)/([^/]*)\.git$")
-GIT_URL = re.compile(r"^git@([^:]*):([^/]*)/([^/]*)\.git$")
+REPO_URL = re.compile(
+    r"^(?:https://(?P<https_domain>[^/]*)/(?P<https_owner>[^/]*)/(?P<https_name>[^/]*)"
+    r"|git@(?P<git_domain>[^:]*):(?P<git_owner>[^/]*)/(?P<git_name>[^/]*))\.git$"
+)
 
 
+@lru_cache(maxsize=512)
 def parse_repo_url(url: str) -> Repository | None:
     """Parse a GitHub repository URL
 
@@ -27,20 +31,26 @@ def parse_repo_url(url: str) -> Repository | None:
     Repository(domain='github.com', owner='alicederyn', name='git-sync')
     >>> parse_repo_url("git@github.com:alicederyn/git-graph-branch.git")
     Repository(domain='github.com', owner='alicederyn', name='git-graph-branch')
+    >>> parse_repo_url("../fork.git") is None
+    True
     """
-    m = HTTPS_URL.match(url)
-    if m:
-        return Repository(*m.groups())
-    m = GIT_URL.match(url)
-    if m:
-        return Repository(*m.groups())
-    return None
+    m = REPO_URL.match(url)
+    if not m:
+        return None
+    if m["https_domain"] is not None:
+        return Repository(m["https_domain"], m["https_owner"], m["https_name"])
+    return Repository(m["git_domain"], m["git_owner"], m["git_name"])
 
 
 def repos_by_domain(urls: Iterable[str]) -> dict[str, list[Repository]]:
+    """Group repositories by domain, dropping duplicates
+
+    >>> repos_by_domain(["https://github.com/a/b.git", "git@github.com:a/b.git"])
+    {'github.com': [Repository(domain='github.com', owner='a', name='b')]}
+    """
     result: dict[str, list[Repository]] = {}
-    for url in urls:
-        repo = parse_repo_url(url)
+    # dict.fromkeys deduplicates while keeping the remotes' order
+    for repo in dict.fromkeys(parse_repo_url(url) for url in urls):
         if repo:
             result.setdefault(repo.domain, []).append(repo)
     return result
@@ -54,51 +64,54 @@ class PullRequest:
     merged_hash: str | None
 
 
-def gql_query(owner: str, name: str) -> str:
-    return f"""
-        repository(owner: "{owner}", name: "{name}" ) {{
-            pullRequests(orderBy: {{ field: UPDATED_AT, direction: ASC }}, last: 50) {{
-                nodes {{
-                    headRefName
-                    headRepository {{
-                        sshUrl
-                        url
-                    }}
-                    commits (last: 1) {{
-                        nodes {{
-                            commit {{
-                                oid
-                            }}
-                        }}
-                    }}
-                    mergeCommit {{
-                        oid
-                    }}
-                }}
-            }}
-        }}
-    """
+PR_QUERY = """
+    repo%d: repository(owner: "%s", name: "%s") {
+        pullRequests(orderBy: { field: UPDATED_AT, direction: ASC }, last: 50) {
+            nodes {
+                headRefName
+                headRepository {
+                    sshUrl
+                    url
+                }
+                commits (last: 1) {
+                    nodes {
+                        commit {
+                            oid
+                        }
+                    }
+                }
+                mergeCommit {
+                    oid
+                }
+            }
+        }
+    }
+"""
+
+
+def gql_query(repos: Iterable[Repository]) -> str:
+    """Build a single query for the last 50 PRs of each repo, aliased repo1..N"""
+    parts = [PR_QUERY % (i, repo.owner, repo.name) for i, repo in enumerate(repos, 1)]
+    return "{" + "".join(parts) + "}"
 
 
 async def fetch_pull_requests_from_domain(
-    token: str, domain: str, repos: list[Repository]
+    token: str, domain: str, repos: list[Repository], session: ClientSession
 ) -> AsyncIterator[PullRequest]:
     endpoint = (
         f"https://api.{domain}/graphql"
         if domain.count(".") == 1
         else f"https://{domain}/api/graphql"
     )
-    client = GraphQLClient(
-        endpoint=endpoint, headers={"Authorization": f"Bearer {token}"}
-    )
-    queries = [
-        f"repo{i}: {gql_query(repo.owner, repo.name)}"
-        for i, repo in enumerate(repos, 1)
-    ]
-    query = "{" + "\n".join(queries) + "}"
-    response = await client.query(query)
-    assert not response.errors
-    for repo_data in response.data.values():
+    async with session.post(
+        endpoint,
+        json={"query": gql_query(repos)},
+        headers={"Authorization": f"Bearer {token}"},
+    ) as response:
+        response.raise_for_status()
+        body = await response.json()
+    assert not body.get("errors")
+    for repo_data in body["data"].values():
         for pr_data in repo_data["pullRequests"]["nodes"]:
             head_repo = pr_data.get("headRepository") or {}
             repo_urls = [head_repo.get("sshUrl"), head_repo.get("url")]
@@ -119,21 +132,28 @@ async def fetch_pull_requests(
 ) -> list[PullRequest]:
     """Fetch the last 50 PRs for each repo
 
-    Issues calls to separate domains concurrently
+    Issues calls to separate domains concurrently, sharing one HTTP session so
+    connections are pooled
     """
     semaphore = Semaphore(max_concurrency)
 
-    async def fetch(domain: str, repos: list[Repository]) -> list[PullRequest]:
+    async def fetch(
+        domain: str, repos: list[Repository], session: ClientSession
+    ) -> list[PullRequest]:
         async with semaphore:
             token = tokens(domain)
             if not token:
                 return []
             return [
-                pr async for pr in fetch_pull_requests_from_domain(token, domain, repos)
+                pr
+                async for pr in fetch_pull_requests_from_domain(
+                    token, domain, repos, session
+                )
             ]
 
-    tasks = []
-    for domain, repos in repos_by_domain(urls).items():
-        tasks.append(fetch(domain, repos))
-    pr_lists = await gather(*tasks)
+    async with ClientSession() as session:
+        tasks = []
+        for domain, repos in repos_by_domain(urls).items():
+            tasks.append(fetch(domain, repos, session))
+        pr_lists = await gather(*tasks)
     return [pr for pr_list in pr_lists for pr in pr_list]